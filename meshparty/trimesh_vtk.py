@@ -3,6 +3,11 @@ from vtk.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray, vtk_to
 import numpy as np
 import os
 
+# Seemingly, VTK may be compiled as 32 bit or 64 bit.
+# We need to make sure that we convert the trilist to the correct dtype
+# based on this. See numpy_to_vtkIdTypeArray() for details.
+_VTK_ID_DTYPE = np.int32 if vtk.vtkIdTypeArray().GetDataTypeSize() == 4 else np.int64
+
 
 def numpy_to_vtk_cells(mat):
     """function to convert a numpy array of integers to a vtkCellArray
@@ -21,21 +26,36 @@ def numpy_to_vtk_cells(mat):
 
     cells = vtk.vtkCellArray()
 
-    # Seemingly, VTK may be compiled as 32 bit or 64 bit.
-    # We need to make sure that we convert the trilist to the correct dtype
-    # based on this. See numpy_to_vtkIdTypeArray() for details.
-    isize = vtk.vtkIdTypeArray().GetDataTypeSize()
-    req_dtype = np.int32 if isize == 4 else np.int64
     n_elems = mat.shape[0]
     n_dim = mat.shape[1]
-    cells.SetCells(n_elems,
-                   numpy_to_vtkIdTypeArray(
-                       np.hstack((np.ones(n_elems)[:, None] * n_dim,
-                                  mat)).astype(req_dtype).ravel(),
-                       deep=1))
+    if hasattr(cells, 'GetOffsetsArray'):
+        # VTK 9 stores cells as separate offsets and connectivity arrays,
+        # so hand it those directly and let it use the numpy buffers
+        connectivity = np.ascontiguousarray(mat, dtype=_VTK_ID_DTYPE).ravel()
+        offsets = np.arange(0, (n_elems + 1) * n_dim, n_dim,
+                            dtype=_VTK_ID_DTYPE)
+        cells.SetData(numpy_to_vtkIdTypeArray(offsets, deep=0),
+                      numpy_to_vtkIdTypeArray(connectivity, deep=0))
+    else:
+        # older VTK takes the legacy [n_dim, v0, v1, ...] layout,
+        # build it directly in the required dtype
+        cell_arr = np.empty((n_elems, n_dim + 1), dtype=_VTK_ID_DTYPE)
+        cell_arr[:, 0] = n_dim
+        np.copyto(cell_arr[:, 1:], mat, casting='unsafe')
+        cells.SetCells(n_elems,
+                       numpy_to_vtkIdTypeArray(cell_arr.ravel(), deep=1))
     return cells
 
 
+def _numpy_to_vtk_no_copy(arr, name=None):
+    # numpy_to_vtk with deep=0 lets vtk alias the numpy buffer
+    # and keeps a reference to it on the vtk array
+    vtk_arr = numpy_to_vtk(arr, deep=0)
+    if name is not None:
+        vtk_arr.SetName(name)
+    return vtk_arr
+
+
 def numpy_rep_to_vtk(vertices, shapes, edges=None):
     """ converts a numpy representation of vertices and vertex connection graph
       to a polydata object and corresponding cell array
@@ -57,7 +77,9 @@ def numpy_rep_to_vtk(vertices, shapes, edges=None):
 
     mesh = vtk.vtkPolyData()
     points = vtk.vtkPoints()
-    points.SetData(numpy_to_vtk(vertices, deep=1))
+    # share the vertex buffer with vtk rather than deep copying it,
+    # which only copies if vertices is not already contiguous
+    points.SetData(_numpy_to_vtk_no_copy(vertices))
     mesh.SetPoints(points)
 
     cells = numpy_to_vtk_cells(shapes)
@@ -70,7 +92,7 @@ def numpy_rep_to_vtk(vertices, shapes, edges=None):
     return mesh, cells, edges
 
 
-def graph_to_vtk(vertices, edges):
+def graph_to_vtk(vertices, edges, validate=True):
     """ converts a numpy representation of vertices and edges
       to a vtkPolyData object
 
@@ -81,6 +103,10 @@ def graph_to_vtk(vertices, edges):
     edges: np.array
         a Mx2 numpy array of vertex connectivity
         where the values are the indexes of connected vertices
+    validate: bool
+        whether to check that edges only refer to existing vertices,
+        set to False to skip this pass over edges for trusted inputs
+        (default True)
 
     Returns
     -------
@@ -93,18 +119,26 @@ def graph_to_vtk(vertices, edges):
     ValueError
         if edges is not 2d or refers to out of bounds vertices
 
+    Notes
+    -----
+    the returned polydata shares memory with vertices (and with edges when
+    it is already a contiguous array of the vtkIdType dtype), so modifying
+    them in place afterwards will modify the polydata
+
     """
     if edges.shape[1] != 2:
         raise ValueError('graph_to_vtk() only works on edge lists')
-    if np.max(edges) >= len(vertices):
-        msg = 'edges refer to non existent vertices {}.'
-        raise ValueError(msg.format(np.max(edges)))
+    if validate:
+        max_ind = np.max(edges)
+        if max_ind >= len(vertices):
+            msg = 'edges refer to non existent vertices {}.'
+            raise ValueError(msg.format(max_ind))
     mesh, cells, edges = numpy_rep_to_vtk(vertices, edges)
     mesh.SetLines(cells)
     return mesh
 
 
-def trimesh_to_vtk(vertices, tris, graph_edges=None):
+def trimesh_to_vtk(vertices, tris, graph_edges=None, validate=True):
     """Return a `vtkPolyData` representation of a :obj:`TriMesh` instance
 
     Parameters
@@ -115,6 +149,10 @@ def trimesh_to_vtk(vertices, tris, graph_edges=None):
         numpy array of Mx3 triangle vertex indices (int64)
     graph_edges: np.array
         numpy array of Kx2 of edges to set as the vtkPolyData.Lines
+    validate: bool
+        whether to check that tris only refer to existing vertices,
+        set to False to skip this pass over tris for trusted inputs
+        (default True)
 
     Returns
     -------
@@ -127,13 +165,21 @@ def trimesh_to_vtk(vertices, tris, graph_edges=None):
         If the input trimesh is not 3D
         or tris refers to out of bounds vertex indices
 
+    Notes
+    -----
+    the returned polydata shares memory with vertices (and with tris when
+    it is already a contiguous array of the vtkIdType dtype), so modifying
+    them in place afterwards will modify the polydata
+
     """
 
     if tris.shape[1] != 3:
         raise ValueError('trimesh_to_vtk() only works on 3D TriMesh instances')
-    if np.max(tris) >= len(vertices):
-        msg = 'edges refer to non existent vertices {}.'
-        raise ValueError(msg.format(np.max(tris)))
+    if validate:
+        max_ind = np.max(tris)
+        if max_ind >= len(vertices):
+            msg = 'edges refer to non existent vertices {}.'
+            raise ValueError(msg.format(max_ind))
     mesh, cells, edges = numpy_rep_to_vtk(vertices, tris, graph_edges)
     mesh.SetPolys(cells)
     if edges is not None:
@@ -148,8 +194,9 @@ def vtk_cellarray_to_shape(vtk_cellarray, ncells):
 
     Parameters
     ----------
-    vtk_cellarray : vtk.vtkCellArray
-        a cell array to convert
+    vtk_cellarray : vtk.vtkCellArray or vtk.vtkIdTypeArray
+        a cell array to convert, or its legacy format data array
+        (as returned by vtkCellArray.GetData())
     ncells: int
         how many cells are in array
 
@@ -160,8 +207,17 @@ def vtk_cellarray_to_shape(vtk_cellarray, ncells):
         uniform shape of the cells.  Will error if cells are not uniform
 
     """
+    if isinstance(vtk_cellarray, vtk.vtkCellArray):
+        if hasattr(vtk_cellarray, 'GetConnectivityArray'):
+            # VTK 9 keeps the vertex indices in their own array,
+            # reshaping it gives a view onto the cell array's memory
+            connectivity = vtk_to_numpy(vtk_cellarray.GetConnectivityArray())
+            return connectivity.reshape(ncells, len(connectivity) // ncells)
+        vtk_cellarray = vtk_cellarray.GetData()
     cellarray = vtk_to_numpy(vtk_cellarray)
-    cellarray = cellarray.reshape(ncells, int(len(cellarray)/ncells))
+    # each cell is stored as [K, v0, ..., vK-1], so drop the leading
+    # count column. On VTK 9 this legacy array is an exported copy
+    cellarray = cellarray.reshape(ncells, len(cellarray) // ncells)
     return cellarray[:, 1:]
 
 
@@ -182,6 +238,11 @@ def decimate_trimesh(trimesh, reduction=.1):
     np.array
         tris, the Kx3 indices of faces
 
+    Notes
+    -----
+    points and tris are views onto the buffers of the decimated vtkPolyData
+    rather than copies, .copy() them if you need to modify them in place
+
     """
 
     poly = trimesh_to_vtk(trimesh.vertices, trimesh.faces)
@@ -192,9 +253,11 @@ def decimate_trimesh(trimesh, reduction=.1):
     dec.Update()
     out_poly = dec.GetOutput()
 
+    # read the points and the polys' cell array directly,
+    # so both results are views onto out_poly's memory
     points = vtk_to_numpy(out_poly.GetPoints().GetData())
     ntris = out_poly.GetNumberOfPolys()
-    tris = vtk_cellarray_to_shape(out_poly.GetPolys().GetData(), ntris)
+    tris = vtk_cellarray_to_shape(out_poly.GetPolys(), ntris)
     return points, tris
 
 
@@ -217,11 +280,14 @@ def remove_unused_verts(verts, faces):
         a reindexed set of faces
 
     """
-    used_verts = np.unique(faces.ravel())
+    # mark the used vertices and build an old->new index map with a
+    # running count, which avoids sorting the face list
+    is_used = np.zeros(len(verts), dtype=bool)
+    is_used[faces.ravel()] = True
+    used_verts = np.flatnonzero(is_used)
+    new_index = np.cumsum(is_used) - 1
     new_verts = verts[used_verts, :]
-    new_face = np.zeros(faces.shape, dtype=faces.dtype)
-    for i in range(faces.shape[1]):
-        new_face[:, i] = np.searchsorted(used_verts, faces[:, i])
+    new_face = new_index[faces].astype(faces.dtype, copy=False)
     return new_verts, new_face
 
 
@@ -246,12 +312,12 @@ def poly_to_mesh_components(poly):
     points = vtk_to_numpy(poly.GetPoints().GetData())
     ntris = poly.GetNumberOfPolys()
     if ntris > 0:
-        tris = vtk_cellarray_to_shape(poly.GetPolys().GetData(), ntris)
+        tris = vtk_cellarray_to_shape(poly.GetPolys(), ntris)
     else:
         tris = None
     nedges = poly.GetNumberOfLines()
     if nedges > 0:
-        edges = vtk_cellarray_to_shape(poly.GetLines().GetData(), nedges)
+        edges = vtk_cellarray_to_shape(poly.GetLines(), nedges)
     else:
         edges = None
     return points, tris, edges
@@ -320,18 +386,20 @@ def render_actors(actors, camera=None, do_save=False, filename=None,
                 key_frame_cameras.append(key_camera)
             return
         iren.AddObserver("KeyPressEvent", vtkKeyPress)
-    renWin.Render()
 
-    if do_save is False:
+    if not do_save:
+        renWin.Render()
         trackCamera = vtk.vtkInteractorStyleTrackballCamera()
         iren.SetInteractorStyle(trackCamera)
         # enable user interface interactor
         iren.Initialize()
         iren.Render()
         iren.Start()
-
-    if do_save is True:
+    else:
+        # switch to offscreen before the first render so we don't
+        # render once onscreen and again offscreen
         renWin.OffScreenRenderingOn()
+        renWin.Render()
         w2if = vtk.vtkWindowToImageFilter()
         w2if.SetScale(scale)
         w2if.SetInput(renWin)
@@ -380,15 +448,19 @@ def camera_from_quat(pos_nm, orient_quat, camera_distance=10000, ngl_correct=Tru
     # right handed units
     M = np.zeros((3, 3), dtype=np.float32)
     quat_vtk.ToMatrix3x3(M)
-    # the default camera orientation is y up
-    up = [0, 1, 0]
-    # calculate default camera position is backed off in positive z
-    pos = [0, 0, camera_distance]
+    # the default camera orientation is y up, so the rotated
+    # up vector is just the second column of the rotation matrix
+    up = (M[0, 1], M[1, 1], M[2, 1])
+    # the default camera position is backed off in positive z,
+    # so rotating it picks out the third column scaled by the distance
+    pos = (camera_distance * M[0, 2],
+           camera_distance * M[1, 2],
+           camera_distance * M[2, 2])
 
     # set the camera rototation by applying the rotation matrix
-    camera.SetViewUp(*np.dot(M, up))
+    camera.SetViewUp(*up)
     # set the camera position by applying the rotation matrix
-    camera.SetPosition(*np.dot(M, pos))
+    camera.SetPosition(*pos)
     if ngl_correct:
         # neuroglancer has positive y going down
         # so apply these azimuth and roll corrections
@@ -462,7 +534,12 @@ def process_colors(color, xyz):
             # if not passing uint8 assume 0-1 mapping
             assert(np.max(color) <= 1.0)
             assert(np.min(color) >= 0)
-            color = np.uint8(color*255)
+            # scale in float32 and cast in the same pass, writing
+            # straight into the uint8 output without a float temporary
+            color_uint8 = np.empty(color.shape, dtype=np.uint8)
+            np.multiply(color, np.float32(255), out=color_uint8,
+                        dtype=np.float32, casting='unsafe')
+            color = color_uint8
     elif color.shape == (len(xyz),):
         # then we want to map colors
         map_colors = True
@@ -471,7 +548,7 @@ def process_colors(color, xyz):
         assert(np.max(color)<=1.0)
         assert(np.min(color)>=0)
         car = np.array(color*255, dtype=np.uint8)
-        color = np.repeat(car[np.newaxis,:],len(xyz),axis=0)
+        color = np.tile(car, (len(xyz), 1))
     else:
         raise ValueError(
             'color must have shapse Nx3 if explicitly setting, or (N,) if mapping, or (3,)')
@@ -525,6 +602,12 @@ def mesh_actor(mesh,
     vtk.vtkActor
         vtkActor representing the mesh (to be passed to render_actors)
 
+    Notes
+    -----
+    the actor's polydata shares memory with mesh.vertices (and with
+    mesh.faces when they are of the vtkIdType dtype), so modifying
+    them in place afterwards will modify what is rendered
+
     """
     if show_link_edges:
         mesh_poly = trimesh_to_vtk(mesh.vertices, mesh.faces, mesh.link_edges)
@@ -533,14 +616,12 @@ def mesh_actor(mesh,
     if vertex_colors is not None:
         vertex_color, map_vertex_color = process_colors(
             vertex_colors, mesh.vertices)
-        vtk_vert_colors = numpy_to_vtk(vertex_color)
-        vtk_vert_colors.SetName('colors')
+        vtk_vert_colors = _numpy_to_vtk_no_copy(vertex_color, 'colors')
         mesh_poly.GetPointData().SetScalars(vtk_vert_colors)
 
     if face_colors is not None:
         face_color, map_face_colors = process_colors(face_colors, mesh.faces)
-        vtk_face_colors = numpy_to_vtk(face_color)
-        vtk_face_colors.SetName('colors')
+        vtk_face_colors = _numpy_to_vtk_no_copy(face_color, 'colors')
         mesh_poly.GetCellData().SetScalars(vtk_face_colors)
 
     mesh_mapper = vtk.vtkPolyDataMapper()
@@ -615,7 +696,7 @@ def skeleton_actor(sk,
         data = sk.edge_properties[edge_property]
         if normalize_property:
             data = data / np.nanmax(data)
-        sk_mesh.GetCellData().SetScalars(numpy_to_vtk(data))
+        sk_mesh.GetCellData().SetScalars(_numpy_to_vtk_no_copy(data))
         lut = vtk.vtkLookupTable()
         if lut_map is not None:
             lut_map(lut)
@@ -631,7 +712,7 @@ def skeleton_actor(sk,
     if data is not None:
         if normalize_property:
             data = data / np.nanmax(data)
-        sk_mesh.GetPointData().SetScalars(numpy_to_vtk(data))
+        sk_mesh.GetPointData().SetScalars(_numpy_to_vtk_no_copy(data))
         lut = vtk.vtkLookupTable()
         if lut_map is not None:
             lut_map(lut)
@@ -670,24 +751,28 @@ def point_cloud_actor(xyz,
     vtk.vtkActor
         an actor with each of the xyz points as spheres of the specified size and color
 
+    Notes
+    -----
+    the actor's points share memory with xyz, so modifying it in place
+    afterwards will modify what is rendered
+
     """
     points = vtk.vtkPoints()
-    points.SetData(numpy_to_vtk(xyz, deep=True))
+    points.SetData(_numpy_to_vtk_no_copy(xyz))
 
     pc = vtk.vtkPolyData()
     pc.SetPoints(points)
 
     color, map_colors = process_colors(color, xyz)
 
-    vtk_colors = numpy_to_vtk(color)
-    vtk_colors.SetName('colors')
+    vtk_colors = _numpy_to_vtk_no_copy(color, 'colors')
 
-    if np.isscalar(size):
-        size = np.full(len(xyz), size)
-    elif len(size) != len(xyz):
-        raise ValueError(
-            'Size must be either a scalar or an len(xyz) x 1 array')
-    pc.GetPointData().SetScalars(numpy_to_vtk(size))
+    scalar_size = np.isscalar(size)
+    if not scalar_size:
+        if len(size) != len(xyz):
+            raise ValueError(
+                'Size must be either a scalar or an len(xyz) x 1 array')
+        pc.GetPointData().SetScalars(_numpy_to_vtk_no_copy(size))
     pc.GetPointData().AddArray(vtk_colors)
 
     ss = vtk.vtkSphereSource()
@@ -698,7 +783,13 @@ def point_cloud_actor(xyz,
     glyph.SetInputArrayToProcess(3, 0, 0, 0, "colors")
     glyph.SetColorModeToColorByScalar()
     glyph.SetSourceConnection(ss.GetOutputPort())
-    glyph.SetScaleModeToScaleByScalar()
+    if scalar_size:
+        # all spheres are the same size, so scale them by a constant
+        # factor rather than attaching a per point array of sizes
+        glyph.SetScaleModeToDataScalingOff()
+        glyph.SetScaleFactor(float(size))
+    else:
+        glyph.SetScaleModeToScaleByScalar()
     glyph.ScalingOn()
     glyph.Update()
 
@@ -751,10 +842,18 @@ def linked_point_actor(vertices_a, vertices_b,
     if len(inds_a) != len(inds_b):
         raise ValueError('Linked points must have the same length')
 
-    link_verts = np.vstack((vertices_a[inds_a], vertices_b[inds_b]))
-    link_edges = np.vstack((np.arange(len(inds_a)),
-                            len(inds_a)+np.arange(len(inds_b))))
-    link_poly = graph_to_vtk(link_verts, link_edges.T)
+    # stack both endpoint sets into one vertex array,
+    # point i in a is linked to point n+i in b
+    n = len(inds_a)
+    link_verts = np.empty((2*n, 3),
+                          dtype=np.result_type(vertices_a, vertices_b))
+    link_verts[:n] = vertices_a[inds_a]
+    link_verts[n:] = vertices_b[inds_b]
+    link_edges = np.empty((n, 2), dtype=np.int64)
+    link_edges[:, 0] = np.arange(n)
+    link_edges[:, 1] = np.arange(n, 2*n)
+    # link_edges index into link_verts by construction
+    link_poly = graph_to_vtk(link_verts, link_edges, validate=False)
 
     mapper = vtk.vtkPolyDataMapper()
     mapper.SetInputData(link_poly)
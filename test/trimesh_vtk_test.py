@@ -1,5 +1,6 @@
 from meshparty import trimesh_io, trimesh_vtk, skeleton_io
 import contextlib
+from vtk.util.numpy_support import vtk_to_numpy
 import numpy as np
 import pytest
 import os
@@ -177,6 +178,43 @@ def test_vtk_errors():
     with pytest.raises(ValueError) as e:
         pd = trimesh_vtk.trimesh_to_vtk(verts, bad_tris)
 
+    # skipping validation leaves the check to the caller
+    pd = trimesh_vtk.trimesh_to_vtk(verts, bad_tris, validate=False)
+    assert(pd.GetNumberOfPolys() == 4)
+
+def test_vtk_cells_roundtrip():
+    for n_dim in [2, 3]:
+        n = 50
+        mat = np.random.randint(0, 100, (n, n_dim)).astype(np.uint32)
+        cells = trimesh_vtk.numpy_to_vtk_cells(mat)
+        assert(cells.GetNumberOfCells() == n)
+        connectivity = vtk_to_numpy(cells.GetConnectivityArray())
+        offsets = vtk_to_numpy(cells.GetOffsetsArray())
+        assert(np.all(connectivity == mat.ravel()))
+        assert(np.all(offsets == np.arange(0, (n+1)*n_dim, n_dim)))
+        mat_out = trimesh_vtk.vtk_cellarray_to_shape(cells, n)
+        assert(mat_out.shape == mat.shape)
+        assert(np.all(mat_out == mat))
+
+def test_process_colors():
+    xyz = np.random.rand(10,3)
+    color, map_colors = trimesh_vtk.process_colors((1, 0.5, 0), xyz)
+    assert(not map_colors)
+    assert(color.dtype == np.uint8)
+    assert(color.shape == (10, 3))
+    assert(np.all(color == np.array([255, 127, 0], dtype=np.uint8)))
+
+    colors = np.random.rand(10,3)
+    color, map_colors = trimesh_vtk.process_colors(colors, xyz)
+    assert(not map_colors)
+    assert(color.dtype == np.uint8)
+    assert(np.all(np.abs(color.astype(int) - np.uint8(colors*255)) <= 1))
+
+    values = np.random.rand(10)
+    color, map_colors = trimesh_vtk.process_colors(values, xyz)
+    assert(map_colors)
+    assert(np.all(color == values))
+
 def test_full_cell_with_links(full_cell_mesh, full_cell_merge_log, tmp_path, monkeypatch):
 
     class MyChunkedGraph(object):